@@ -1,19 +1,43 @@
 import os
 import argparse
+import errno
+import mmap
+import re
 import sys
 import random
 import string
+from multiprocessing.pool import ThreadPool
 
 MAX_TXT_GB = 1024 ** 3  # 1 GB in bytes
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+TXT_SIZE_BUCKETS = [  # (cumulative weight, min size, max size)
+    (0.3, 1 * 1024**2, 50 * 1024**2),
+    (0.6, 50 * 1024**2, 200 * 1024**2),
+    (0.85, 200 * 1024**2, 800 * 1024**2),
+    (1.0, 800 * 1024**2, MAX_TXT_GB),
+]
+DIRECT_IO_MIN_SIZE = 64 * 1024**2  # Files at least this large bypass the page cache
+SOFT_MAX_BUFFER_LEN = 16 * 1024**2  # Upper bound for the shared fill chunks
+
+# Fill chunks are built once and shared by every file (and every worker
+# thread) instead of being reallocated per call.
+_TEXT_CHUNK = b"0" * min(CHUNK_SIZE, SOFT_MAX_BUFFER_LEN)
+_ZERO_CHUNK = b"\x00" * min(CHUNK_SIZE, SOFT_MAX_BUFFER_LEN)
+
+_SIZE_RE = re.compile(r"^\s*([0-9]+\.?[0-9]*|\.[0-9]+)\s*(KB|MB|GB|B)?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16  # POSIX minimum
 
 
 def parse_size(size_str: str) -> int:
-    size_str = size_str.strip().upper()
-    units = {"KB": 1024, "MB": 1024**2, "GB": 1024**3}
-    for unit, factor in units.items():
-        if size_str.endswith(unit):
-            return int(float(size_str[:-len(unit)]) * factor)
-    return int(size_str)
+    match = _SIZE_RE.match(size_str)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: '{size_str}' (expected e.g. 500MB, 2GB).")
+    return int(float(match.group(1)) * _SIZE_UNITS[(match.group(2) or "").upper()])
 
 
 def parse_args():
@@ -25,30 +49,105 @@ def parse_args():
     parser.add_argument("--path", type=str, required=True, help="Base path.")
     parser.add_argument("--folder", type=str, required=True, help="Folder name to create.")
     parser.add_argument("--dry-run", action="store_true", help="Simulate actions without actually creating files.")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="Number of files written concurrently.")
+    parser.add_argument("--sparse", action="store_true",
+                        help="Create sparse files with the right logical size but no allocated data blocks.")
     return parser.parse_args()
 
 
-def write_file_in_chunks(file_path: str, size: int, is_text: bool = True):
-    chunk_size = 1024 * 1024  # 1 MB
+def write_repeated(fd: int, chunk, size: int):
+    # Every chunk holds a single repeated byte, so one writev can point up to
+    # IOV_MAX entries at the same buffer: a GB-sized file takes a handful of
+    # syscalls without ever allocating a file-sized buffer.
+    view = memoryview(chunk)
+    iov = None
     remaining = size
+    try:
+        while remaining > 0:
+            if hasattr(os, "writev"):
+                full, tail = divmod(remaining, len(view))
+                iov = [view] * min(full, IOV_MAX)
+                if len(iov) < IOV_MAX and tail:
+                    iov.append(view[:tail])
+                remaining -= os.writev(fd, iov)
+            else:
+                remaining -= os.write(fd, view[:remaining])
+    finally:
+        # Drop every export of `chunk` so a traceback holding this frame does
+        # not keep a caller's mmap pinned (mmap.close() would raise BufferError).
+        iov = None
+        view.release()
+
+
+def write_direct(file_path: str, size: int, fill: bytes = None) -> bool:
+    # Returns False when O_DIRECT is unavailable so the caller can fall back.
+    if not hasattr(os, "O_DIRECT") or size < DIRECT_IO_MIN_SIZE:
+        return False
+    try:
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+    except OSError as e:
+        if e.errno == errno.EINVAL:
+            return False
+        raise
+    try:
+        # O_DIRECT needs page-aligned buffers and lengths; anonymous mmap is
+        # page-aligned, so round the tail up and truncate back afterwards.
+        written = True
+        with mmap.mmap(-1, len(_ZERO_CHUNK)) as buf:
+            if fill:
+                buf.write(fill)
+            with memoryview(buf) as view:
+                # Handle EINVAL while the buffer is still open so the
+                # exception is gone before the mmap gets closed.
+                try:
+                    write_repeated(fd, view, -(-size // mmap.PAGESIZE) * mmap.PAGESIZE)
+                except OSError as e:
+                    if e.errno != errno.EINVAL:
+                        raise
+                    written = False
+        if written:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+    return written
+
 
+def write_file_in_chunks(file_path: str, size: int, is_text: bool = True):
     if is_text:
-        zero_chunk = "0" * chunk_size
-        with open(file_path, "w", encoding="utf-8") as f:
-            while remaining > 0:
-                to_write = min(remaining, chunk_size)
-                f.write(zero_chunk[:to_write])
-                remaining -= to_write
+        if write_direct(file_path, size, _TEXT_CHUNK):
+            return
+        with open(file_path, "wb", buffering=0) as f:
+            write_repeated(f.fileno(), _TEXT_CHUNK, size)
     else:
-        with open(file_path, "wb") as f:
-            zero_chunk = b"\x00" * chunk_size
-            while remaining > 0:
-                to_write = min(remaining, chunk_size)
-                f.write(zero_chunk[:to_write])
-                remaining -= to_write
+        # Reserve the blocks without copying any user data; the kernel hands
+        # back zeros on read. Fall back to writing zeros where unsupported.
+        if hasattr(os, "posix_fallocate") and size > 0:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+            finally:
+                os.close(fd)
+        if write_direct(file_path, size):
+            return
+        with open(file_path, "wb", buffering=0) as f:
+            write_repeated(f.fileno(), _ZERO_CHUNK, size)
+
+
+def create_sparse_file(file_path: str, size: int):
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
 
 
-def create_data_folder_with_files(total_size_bytes: int, num_files: int, base_path: str, folder_name: str, dry_run: bool):
+def create_data_folder_with_files(total_size_bytes: int, num_files: int, base_path: str, folder_name: str, dry_run: bool,
+                                  workers: int = 1, sparse: bool = False):
     if num_files <= 20:
         raise ValueError("Number of files must be greater than 20 (20 are reserved for BIN).")
 
@@ -66,18 +165,8 @@ def create_data_folder_with_files(total_size_bytes: int, num_files: int, base_pa
     bin_budget = total_size_bytes - txt_budget
 
     # Generate random txt sizes
-    txt_sizes = []
-    for _ in range(num_txt):
-        choice = random.random()
-        if choice < 0.3:
-            size = random.randint(1 * 1024**2, 50 * 1024**2)
-        elif choice < 0.6:
-            size = random.randint(50 * 1024**2, 200 * 1024**2)
-        elif choice < 0.85:
-            size = random.randint(200 * 1024**2, 800 * 1024**2)
-        else:
-            size = random.randint(800 * 1024**2, MAX_TXT_GB)
-        txt_sizes.append(size)
+    buckets = random.choices(TXT_SIZE_BUCKETS, cum_weights=[b[0] for b in TXT_SIZE_BUCKETS], k=num_txt)
+    txt_sizes = [random.randint(low, high) for _, low, high in buckets]
 
     # Scale txt sizes to match txt_budget
     total_txt = sum(txt_sizes)
@@ -96,21 +185,25 @@ def create_data_folder_with_files(total_size_bytes: int, num_files: int, base_pa
     if diff > 0:
         bin_sizes[-1] += diff
 
-    # Write TXT files
-    for i, size in enumerate(txt_sizes, start=1):
-        file_path = os.path.join(folder_path, f"irelocatetest_{i}.txt")
-        if dry_run:
-            print(f"[DRY-RUN] Would create TXT: {file_path} ({size} bytes)")
-        else:
-            write_file_in_chunks(file_path, size, is_text=True)
-
-    # Write BIN files
-    for i, size in enumerate(bin_sizes, start=1):
-        file_path = os.path.join(folder_path, f"irelocatetest_{i}.bin")
-        if dry_run:
-            print(f"[DRY-RUN] Would create BIN: {file_path} ({size} bytes)")
-        else:
-            write_file_in_chunks(file_path, size, is_text=False)
+    # Join the folder once; each file only formats its index and extension.
+    prefix = os.path.join(folder_path, "irelocatetest_")
+    tasks = [(f"{prefix}{i}.txt", size, True) for i, size in enumerate(txt_sizes, start=1)]
+    tasks += [(f"{prefix}{i}.bin", size, False) for i, size in enumerate(bin_sizes, start=1)]
+
+    if dry_run:
+        for file_path, size, is_text in tasks:
+            print(f"[DRY-RUN] Would create {'TXT' if is_text else 'BIN'}: {file_path} ({size} bytes)")
+    else:
+        if sparse:
+            print("Warning: sparse files report their full size but use no disk space; "
+                  "their content reads back as zero bytes and uploads still transfer every byte.", file=sys.stderr)
+        # Files are independent and file I/O releases the GIL, so write them
+        # concurrently to overlap syscalls across files.
+        with ThreadPool(max(1, min(workers, len(tasks)))) as pool:
+            if sparse:
+                pool.starmap(create_sparse_file, [(file_path, size) for file_path, size, _ in tasks])
+            else:
+                pool.starmap(write_file_in_chunks, tasks)
 
     total_created = sum(txt_sizes) + sum(bin_sizes)
     
@@ -120,7 +213,8 @@ def create_data_folder_with_files(total_size_bytes: int, num_files: int, base_pa
 def main():
     args = parse_args()
     try:
-        create_data_folder_with_files(args.total_size, args.num_files, args.path, args.folder, args.dry_run)
+        create_data_folder_with_files(args.total_size, args.num_files, args.path, args.folder, args.dry_run, args.workers,
+                                      args.sparse)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
@@ -1,31 +1,85 @@
 import os
 import argparse
+import contextlib
+import errno
 import sys
 import subprocess
 
+try:
+    import irods.keywords as kw
+    from irods.exception import iRODSException
+    from irods.session import iRODSSession
+except ImportError:  # python-irodsclient is optional; only needed for --use-prc
+    iRODSSession = None
+
 # Dictionary of iput flags
 IPUT_PARAMS = {
     "resource": {
         "flag": "-R",
         "help": "Specify the resource to store data."
+    },
+    "transfer_threads": {
+        "flag": "-N",
+        "help": "Number of parallel transfer threads per file."
+    },
+    "bulk": {
+        "flag": "-b",
+        "help": "Bulk upload to reduce overhead for small files (default: on when the average file size is below 32 MB)."
     }
 }
 
+BULK_MAX_AVG_SIZE = 32 * 1024**2
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Upload an existing folder to iRODS and optionally replicate it to another resource."
     )
     parser.add_argument("--folder", type=str, required=True,
                         help="Local folder containing files to upload.")
-    parser.add_argument("--irods-path", type=str, required=True,
+    parser.add_argument("--irods-path", type=str,
                         help="iRODS collection path to upload files to.")
     parser.add_argument("--resource", type=str,
                         help=IPUT_PARAMS["resource"]["help"])
+    parser.add_argument("--transfer-threads", type=int, default=min(16, (os.cpu_count() or 1) * 2),
+                        help=IPUT_PARAMS["transfer_threads"]["help"])
+    parser.add_argument("--bulk", action=argparse.BooleanOptionalAction, default=None,
+                        help=IPUT_PARAMS["bulk"]["help"])
     parser.add_argument("--replicate", type=str,
                         help="Replicate uploaded data to this second resource.")
+    parser.add_argument("--explicit-mkdir", action="store_true",
+                        help="Create --irods-path with imkdir -p (including missing parent collections) before running iput. "
+                             "Without it no separate imkdir is run: --irods-path must already exist, and iput -r "
+                             "creates <irods-path>/<folder> itself.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Capture and print iput output (discarded by default).")
+    parser.add_argument("--use-prc", action="store_true",
+                        help="Upload and replicate through python-irodsclient over one session instead of iput/irepl.")
     parser.add_argument("--dry-run", action="store_true",
                         help="Simulate actions without executing them.")
-    return parser.parse_args()
+    parser.add_argument("--local-fast-copy", type=str, metavar="DEST_DIR",
+                        help="Copy the folder into this locally mounted directory with in-kernel copies instead of uploading with iput.")
+    args = parser.parse_args()
+    if args.local_fast_copy:
+        upload_only = [flag for flag, given in (("--irods-path", args.irods_path is not None),
+                                                ("--resource", args.resource is not None),
+                                                ("--replicate", args.replicate is not None),
+                                                ("--use-prc", args.use_prc),
+                                                ("--bulk/--no-bulk", args.bulk is not None),
+                                                ("--explicit-mkdir", args.explicit_mkdir),
+                                                ("--verbose", args.verbose)) if given]
+        if upload_only:
+            parser.error(f"--local-fast-copy cannot be combined with iRODS upload options: {', '.join(upload_only)}.")
+    elif not args.irods_path:
+        parser.error("--irods-path is required unless --local-fast-copy is given.")
+    if args.use_prc:
+        if iRODSSession is None:
+            parser.error("--use-prc requires python-irodsclient to be installed.")
+        iput_only = [flag for flag, given in (("--bulk/--no-bulk", args.bulk is not None),
+                                              ("--explicit-mkdir", args.explicit_mkdir),
+                                              ("--verbose", args.verbose)) if given]
+        if iput_only:
+            parser.error(f"{', '.join(iput_only)} only apply to iput and cannot be combined with --use-prc.")
+    return args
 
 def ensure_irods_collection(path: str, dry_run: bool):
     print(f"Ensuring iRODS collection '{path}' exists...")
@@ -44,17 +98,71 @@ def ensure_irods_collection(path: str, dry_run: bool):
             print("STDERR:", e.stderr)
         sys.exit(1)
 
-def upload_folder_to_irods(local_folder: str, irods_path: str, resource: str = None, dry_run: bool = False):
+def average_file_size(folder: str) -> float:
+    total = count = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+            count += 1
+    return total / count if count else 0
+
+def open_irods_session():
+    env_file = os.environ.get("IRODS_ENVIRONMENT_FILE", os.path.expanduser("~/.irods/irods_environment.json"))
+    return iRODSSession(irods_env_file=env_file)
+
+def put_folder(session, local_folder: str, target: str, resource: str = None, transfer_threads: int = None):
+    # Every collection and data object goes through the same authenticated
+    # connection instead of one iput process per upload.
+    options = {kw.DEST_RESC_NAME_KW: resource} if resource else {}
+    if transfer_threads is not None:
+        options["num_threads"] = transfer_threads
+    for root, _, files in os.walk(local_folder):
+        rel = os.path.relpath(root, local_folder)
+        collection = target if rel == "." else f"{target}/{rel.replace(os.sep, '/')}"
+        session.collections.create(collection)
+        for name in files:
+            session.data_objects.put(os.path.join(root, name), f"{collection}/{name}", **options)
+
+def upload_folder_to_irods(local_folder: str, irods_path: str, resource: str = None, dry_run: bool = False,
+                           transfer_threads: int = None, bulk: bool = None, session=None,
+                           explicit_mkdir: bool = False, verbose: bool = False, use_prc: bool = False):
     if not os.path.isdir(local_folder):
         print(f"Error: Folder '{local_folder}' does not exist or is not a directory.", file=sys.stderr)
         sys.exit(1)
 
-    ensure_irods_collection(irods_path, dry_run)
+    uploaded_folder_name = os.path.basename(os.path.normpath(local_folder))
+    uploaded_folder_path = os.path.join(irods_path, uploaded_folder_name)
+
+    if use_prc:
+        print(f"Uploading '{local_folder}' to iRODS path '{irods_path}' via python-irodsclient...")
+        if dry_run:
+            print(f"[DRY-RUN] Would create '{uploaded_folder_path}' and put each file over one session.")
+            print(f"[DRY-RUN] Skipping actual upload.")
+            return uploaded_folder_path
+        try:
+            put_folder(session, local_folder, uploaded_folder_path, resource, transfer_threads)
+            print(f"Successfully uploaded folder '{local_folder}' to '{irods_path}'")
+        except iRODSException as e:
+            print("iRODS upload failed!")
+            print("ERROR:", e)
+            sys.exit(1)
+        return uploaded_folder_path
+
+    # With an existing --irods-path, iput -r creates <irods-path>/<folder>
+    # itself, so the imkdir round-trip is only made when asked for.
+    if explicit_mkdir:
+        ensure_irods_collection(irods_path, dry_run)
 
     print(f"Uploading '{local_folder}' to iRODS path '{irods_path}'...")
     cmd = ["iput", "-r"]
     if resource:
         cmd.extend([IPUT_PARAMS["resource"]["flag"], resource])
+    if transfer_threads is not None:
+        cmd.extend([IPUT_PARAMS["transfer_threads"]["flag"], str(transfer_threads)])
+    if bulk is None:
+        bulk = average_file_size(local_folder) < BULK_MAX_AVG_SIZE
+    if bulk:
+        cmd.append(IPUT_PARAMS["bulk"]["flag"])
     cmd.extend([local_folder, irods_path])
 
     print(f"Running command: {' '.join(cmd)}")
@@ -62,7 +170,10 @@ def upload_folder_to_irods(local_folder: str, irods_path: str, resource: str = N
         print(f"[DRY-RUN] Skipping actual upload.")
     else:
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            # iput output can be large for big folders; only stderr is needed
+            # to report failures, so stdout is discarded unless asked for.
+            stdout = subprocess.PIPE if verbose else subprocess.DEVNULL
+            result = subprocess.run(cmd, stdout=stdout, stderr=subprocess.PIPE, text=True, check=True)
             print(f"Successfully uploaded folder '{local_folder}' to '{irods_path}'")
             if result.stdout:
                 print(result.stdout)
@@ -74,11 +185,76 @@ def upload_folder_to_irods(local_folder: str, irods_path: str, resource: str = N
                 print("STDERR:", e.stderr)
             sys.exit(1)
 
-    uploaded_folder_name = os.path.basename(os.path.normpath(local_folder))
-    return os.path.join(irods_path, uploaded_folder_name)
+    return uploaded_folder_path
+
+def copy_file_in_kernel(src: str, dst: str):
+    # copy_file_range/sendfile move the data inside the kernel (or reflink it
+    # on XFS/Btrfs) instead of reading it into Python and writing it back.
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+        offset = 0
+        use_copy_range = hasattr(os, "copy_file_range")
+        while offset < size:
+            if use_copy_range:
+                try:
+                    copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+                except OSError as e:
+                    if e.errno not in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP):
+                        raise
+                    use_copy_range = False
+                    continue
+            else:
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                copied = os.sendfile(dst_fd, src_fd, offset, size - offset)
+            if copied == 0:
+                break
+            offset += copied
 
-def replicate_to_resource(uploaded_folder_path: str, second_resource: str, dry_run: bool):
+def copy_folder_locally(local_folder: str, dest_dir: str, dry_run: bool = False):
+    if not os.path.isdir(local_folder):
+        print(f"Error: Folder '{local_folder}' does not exist or is not a directory.", file=sys.stderr)
+        sys.exit(1)
+
+    target = os.path.join(dest_dir, os.path.basename(os.path.normpath(local_folder)))
+    # Copying into the source (or a folder nested with it) would reopen the
+    # source files with "wb" and truncate them.
+    real_source, real_target = os.path.realpath(local_folder), os.path.realpath(target)
+    if os.path.commonpath([real_source, real_target]) in (real_source, real_target):
+        print(f"Error: Destination '{target}' overlaps source folder '{local_folder}'.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Copying '{local_folder}' to local path '{target}'...")
+    if dry_run:
+        print(f"[DRY-RUN] Skipping actual copy.")
+        return target
+    for root, _, files in os.walk(local_folder):
+        dest_root = os.path.join(target, os.path.relpath(root, local_folder))
+        os.makedirs(dest_root, exist_ok=True)
+        for name in files:
+            copy_file_in_kernel(os.path.join(root, name), os.path.join(dest_root, name))
+    print(f"Successfully copied folder '{local_folder}' to '{target}'")
+    return target
+
+def replicate_to_resource(uploaded_folder_path: str, second_resource: str, dry_run: bool, session=None,
+                          use_prc: bool = False):
     print(f"Replicating '{uploaded_folder_path}' to resource '{second_resource}'...")
+    if use_prc:
+        if dry_run:
+            print(f"[DRY-RUN] Would replicate each data object over the python-irodsclient session.")
+            print(f"[DRY-RUN] Skipping actual replication.")
+            return
+        try:
+            for _, _, data_objects in session.collections.get(uploaded_folder_path).walk():
+                for obj in data_objects:
+                    session.data_objects.replicate(obj.path, resource=second_resource)
+            print(f"Successfully replicated '{uploaded_folder_path}' to resource '{second_resource}'")
+        except iRODSException as e:
+            print("Replication failed!")
+            print("ERROR:", e)
+            sys.exit(1)
+        return
+
     cmd = ["irepl", "-r", "-R", second_resource, uploaded_folder_path]
     print(f"Running command: {' '.join(cmd)}")
     if dry_run:
@@ -100,9 +276,18 @@ def replicate_to_resource(uploaded_folder_path: str, second_resource: str, dry_r
 def main():
     args = parse_args()
     try:
-        uploaded_folder_path = upload_folder_to_irods(args.folder, args.irods_path, args.resource, args.dry_run)
-        if args.replicate:
-            replicate_to_resource(uploaded_folder_path, args.replicate, args.dry_run)
+        if args.local_fast_copy:
+            copy_folder_locally(args.folder, args.local_fast_copy, args.dry_run)
+            return
+        # A single authenticated session serves the collection create, the
+        # upload and the replication instead of one icommand process each.
+        use_session = args.use_prc and not args.dry_run
+        with open_irods_session() if use_session else contextlib.nullcontext() as session:
+            uploaded_folder_path = upload_folder_to_irods(args.folder, args.irods_path, args.resource, args.dry_run,
+                                                          args.transfer_threads, args.bulk, session,
+                                                          args.explicit_mkdir, args.verbose, args.use_prc)
+            if args.replicate:
+                replicate_to_resource(uploaded_folder_path, args.replicate, args.dry_run, session, args.use_prc)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)